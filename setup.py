@@ -27,6 +27,9 @@ setup(
         'Werkzeug',
         'gunicorn',
     ],
+    extras_require={
+        'orjson': ['orjson'],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Information Technology",
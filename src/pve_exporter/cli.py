@@ -93,6 +93,12 @@ def main():
                         help='Address to which the exporter will bind')
     parser.add_argument('--server.keyfile', dest='server_keyfile', help='SSL key for server')
     parser.add_argument('--server.certfile', dest='server_certfile', help='SSL certificate for server')
+    parser.add_argument('--cache.ttl', dest='cache_ttl', type=float, default=5,
+                        help='Seconds to cache cluster wide PVE API responses, 0 disables '
+                             'caching (default: 5)')
+    parser.add_argument('--cache.max-stale', dest='cache_max_stale', type=float, default=0,
+                        help='Seconds to serve metrics of the last successful scrape if PVE is '
+                             'unreachable, 0 disables (default: 0)')
 
     params = parser.parse_args()
 
@@ -121,6 +127,7 @@ def main():
     }
 
     if config.valid:
-        start_http_server(config, gunicorn_options, collectors)
+        start_http_server(config, gunicorn_options, collectors, params.cache_ttl,
+                          params.cache_max_stale)
     else:
         parser.error(str(config))
@@ -4,19 +4,31 @@ Prometheus collecters for Proxmox VE cluster.
 # pylint: disable=too-few-public-methods
 
 import collections
+import concurrent.futures
+import functools
 import itertools
 import logging
 import re
+import threading
+import time
+from collections.abc import Mapping
 
-from prometheus_client.samples import Sample
 from prometheus_client.parser import text_string_to_metric_families
 from prometheus_client.registry import Collector
 from proxmoxer import ProxmoxAPI
+from proxmoxer.backends.https import AuthenticationError, JsonSerializer
 from proxmoxer.core import ResourceException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
 
-from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
 from prometheus_client.core import GaugeMetricFamily
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 CollectorsOptions = collections.namedtuple('CollectorsOptions', [
     'status',
     'version',
@@ -27,6 +39,216 @@ CollectorsOptions = collections.namedtuple('CollectorsOptions', [
     'volumes',
 ])
 
+_NOTES_METRICS_RE = re.compile(r'#+\s*Prometheus metrics\s*```(.*?)```', re.MULTILINE | re.DOTALL)
+_NOTES_SOURCE_LABELS = {'__source': 'Datacenter > Notes'}
+
+_FETCH_DURATION = Histogram(
+    'pve_scrape_fetch_seconds',
+    'Duration of PVE API requests',
+    ['target', 'endpoint'],
+)
+_FETCH_ERRORS = Counter(
+    'pve_scrape_fetch_errors',
+    'Failed PVE API requests',
+    ['target', 'endpoint'],
+)
+
+# Placeholders for resource ids in the endpoint label, keyed by the parent
+# path segment.
+_ENDPOINT_PARAMS = {
+    'nodes': 'node',
+    'qemu': 'vmid',
+    'lxc': 'vmid',
+    'storage': 'storage',
+}
+
+class TimedPve:
+    """
+    Proxy for the ProxmoxAPI recording duration and errors of api requests
+    per target. Resource ids are replaced by placeholders in the endpoint
+    label, e.g., /nodes/{node}/qemu/{vmid}/config.
+    """
+
+    def __init__(self, resource, target, endpoint=''):
+        self._resource = resource
+        self._target = target
+        self._endpoint = endpoint
+
+    def __getattr__(self, item):
+        return TimedPve(getattr(self._resource, item), self._target, f'{self._endpoint}/{item}')
+
+    def __call__(self, resource_id):
+        segment = self._endpoint.rsplit('/', 1)[-1]
+        placeholder = _ENDPOINT_PARAMS.get(segment, 'id')
+        return TimedPve(self._resource(resource_id), self._target,
+                        f'{self._endpoint}/{{{placeholder}}}')
+
+    def get(self, **params):
+        """
+        Issue a GET request against the endpoint.
+        """
+        start = time.perf_counter()
+        try:
+            return self._resource.get(**params)
+        except Exception:
+            _FETCH_ERRORS.labels(self._target, self._endpoint).inc()
+            raise
+        finally:
+            _FETCH_DURATION.labels(self._target, self._endpoint).observe(
+                time.perf_counter() - start)
+
+class TTLCache:
+    """
+    Minimal thread-safe cache where every entry expires after a given number
+    of seconds.
+    """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl, fetch):
+        """
+        Return the cached value for key or call fetch() and cache its result
+        for ttl seconds.
+        """
+
+        if ttl <= 0:
+            return fetch()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        value = fetch()
+
+        with self._lock:
+            if len(self._entries) >= self._maxsize:
+                self._evict(now)
+            self._entries[key] = (now + ttl, value)
+
+        return value
+
+    def _evict(self, now):
+        expired = [key for key, (expiry, _) in self._entries.items() if expiry <= now]
+        for key in expired:
+            del self._entries[key]
+
+        # Still full, drop the oldest entry.
+        if len(self._entries) >= self._maxsize:
+            del self._entries[next(iter(self._entries))]
+
+_RESPONSE_CACHE = TTLCache()
+
+class _context_property(property): # pylint: disable=invalid-name
+    """
+    Property computed once per PveContext instance. Unlike
+    functools.cached_property (which on Python < 3.12 holds one lock shared
+    by all instances), concurrent scrapes of different targets do not wait on
+    each other.
+    """
+
+    def __init__(self, func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def getter(ctx):
+            with ctx._locks[name]: # pylint: disable=protected-access
+                values = ctx._values # pylint: disable=protected-access
+                if name not in values:
+                    values[name] = func(ctx)
+                return values[name]
+
+        super().__init__(getter)
+
+class PveContext:
+    """
+    Proxmox VE api access shared by the collectors of a scrape. Responses of
+    cluster wide endpoints are fetched at most once per scrape and cached for
+    a couple of seconds across scrapes.
+
+    The responses are shared, collectors must not modify them.
+    """
+
+    def __init__(self, pve, cache_key, ttl=5):
+        self.pve = pve
+        self._cache_key = cache_key
+        self._ttl = ttl
+        self._values = {}
+        self._locks = collections.defaultdict(threading.Lock)
+
+    def _cached(self, fetch, key, ttl=None):
+        if ttl is None:
+            ttl = self._ttl
+        return _RESPONSE_CACHE.get((self._cache_key, key), ttl, fetch)
+
+    @_context_property
+    def status(self):
+        """
+        Result of /cluster/status
+        """
+        return self._cached(self.pve.cluster.status.get, 'cluster/status')
+
+    @_context_property
+    def resources(self):
+        """
+        Result of /cluster/resources
+        """
+        return self._cached(self.pve.cluster.resources.get, 'cluster/resources')
+
+    @_context_property
+    def resources_by_type(self):
+        """
+        Entries from /cluster/resources grouped by their type
+        """
+        result = collections.defaultdict(list)
+        for resource in self.resources:
+            result[resource['type']].append(resource)
+        return result
+
+    @_context_property
+    def resources_vm(self):
+        """
+        Guests from /cluster/resources, i.e. /cluster/resources?type=vm
+        """
+        return [resource for resource in self.resources if resource['type'] in ('qemu', 'lxc')]
+
+    @_context_property
+    def nodes(self):
+        """
+        Result of /nodes
+        """
+        return self._cached(self.pve.nodes.get, 'nodes')
+
+    @_context_property
+    def cluster_options(self):
+        """
+        Result of /cluster/options
+        """
+        return self.pve.cluster.options.get()
+
+    @_context_property
+    def version(self):
+        """
+        Result of /version
+        """
+        return self.pve.version.get()
+
+    def prefetch(self, names):
+        """
+        Concurrently populate the given properties. Exceptions are propagated.
+        """
+        if not names:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(names)) as executor:
+            futures = [executor.submit(getattr, self, name) for name in names]
+            for future in futures:
+                future.result()
+
 class StatusCollector:
     """
     Collects Proxmox VE Node/VM/CT-Status
@@ -39,8 +261,10 @@ class StatusCollector:
     pve_up{id="qemu/102"} 1.0
     """
 
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('status', 'resources')
+
+    def __init__(self, ctx):
+        self._ctx = ctx
 
     def collect(self): # pylint: disable=missing-docstring
         status_metrics = GaugeMetricFamily(
@@ -48,7 +272,7 @@ class StatusCollector:
             'Node/VM/CT-Status is online/running',
             labels=['id'])
 
-        for entry in self._pve.cluster.status.get():
+        for entry in self._ctx.status:
             if entry['type'] == 'node':
                 label_values = [entry['id']]
                 status_metrics.add_metric(label_values, entry['online'])
@@ -58,7 +282,7 @@ class StatusCollector:
             else:
                 raise ValueError('Got unexpected status entry type {:s}'.format(entry['type']))
 
-        for resource in self._pve.cluster.resources.get(type='vm'):
+        for resource in self._ctx.resources_vm:
             label_values = [resource['id']]
             status_metrics.add_metric(label_values, resource['status'] == 'running')
 
@@ -75,11 +299,13 @@ class VersionCollector:
 
     LABEL_WHITELIST = ['release', 'repoid', 'version']
 
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('version',)
+
+    def __init__(self, ctx):
+        self._ctx = ctx
 
     def collect(self): # pylint: disable=missing-docstring
-        version_items = self._pve.version.get().items()
+        version_items = self._ctx.version.items()
         version = {key: value for key, value in version_items if key in self.LABEL_WHITELIST}
 
         labels, label_values = zip(*version.items())
@@ -102,11 +328,13 @@ class ClusterNodeCollector:
         nodeid="0"} 1.0
     """
 
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('status',)
+
+    def __init__(self, ctx):
+        self._ctx = ctx
 
     def collect(self): # pylint: disable=missing-docstring
-        nodes = [entry for entry in self._pve.cluster.status.get() if entry['type'] == 'node']
+        nodes = [entry for entry in self._ctx.status if entry['type'] == 'node']
         labels = ['id', 'level', 'name', 'nodeid']
 
         if nodes:
@@ -130,24 +358,23 @@ class ClusterInfoCollector:
     pve_cluster_info{id="cluster/pvec",nodes="2",quorate="1",version="2"} 1.0
     """
 
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('status',)
+
+    def __init__(self, ctx):
+        self._ctx = ctx
 
     def collect(self): # pylint: disable=missing-docstring
-        clusters = [entry for entry in self._pve.cluster.status.get() if entry['type'] == 'cluster']
+        # Build new entries with cluster-prefixed id and without superflous
+        # keys. The status entries are shared with other collectors.
+        clusters = [
+            {'id': 'cluster/{:s}'.format(entry['name']),
+             **{key: value for key, value in entry.items() if key not in ('id', 'type', 'name')}}
+            for entry in self._ctx.status if entry['type'] == 'cluster'
+        ]
 
         if clusters:
-            # Remove superflous keys.
-            for cluster in clusters:
-                del cluster['type']
-
-            # Add cluster-prefix to id.
-            for cluster in clusters:
-                cluster['id'] = 'cluster/{:s}'.format(cluster['name'])
-                del cluster['name']
-
             # Yield remaining data.
-            labels = clusters[0].keys()
+            labels = list(clusters[0].keys())
             info_metrics = GaugeMetricFamily(
                 'pve_cluster_info',
                 'Cluster info',
@@ -165,8 +392,10 @@ class ClusterResourcesCollector:
     usage for cluster nodes and guests.
     """
 
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('resources',)
+
+    def __init__(self, ctx):
+        self._ctx = ctx
 
     def collect(self): # pylint: disable=missing-docstring
         metrics = {
@@ -246,18 +475,18 @@ class ClusterResourcesCollector:
             },
         }
 
-        for resource in self._pve.cluster.resources.get():
-            restype = resource['type']
+        metrics_keys = frozenset(metrics)
+        label_tuples = {key: tuple(metric._labelnames) for key, metric in metrics.items()}
 
-            if restype in info_lookup:
-                label_values = [resource.get(key, '') for key in info_lookup[restype]['labels']]
-                info_lookup[restype]['gauge'].add_metric(label_values, 1)
+        for resource in self._ctx.resources:
+            info = info_lookup.get(resource['type'])
+            if info is not None:
+                label_values = [resource.get(key, '') for key in info['labels']]
+                info['gauge'].add_metric(label_values, 1)
 
-            for key, metric_value in resource.items():
-                if key in metrics:
-                    metric = metrics[key]
-                    label_values = [resource[labelname] for labelname in metric._labelnames if labelname in resource]
-                    metric.add_metric(label_values, metric_value)
+            for key in metrics_keys & resource.keys():
+                label_values = [resource[labelname] for labelname in label_tuples[key] if labelname in resource]
+                metrics[key].add_metric(label_values, resource[key])
 
         return itertools.chain(metrics.values(), info_metrics.values())
 
@@ -271,8 +500,11 @@ class ClusterNodeConfigCollector:
     pve_onboot_status{id="qemu/113",node="XXXX",type="qemu"} 1.0
     """
 
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('resources', 'nodes')
+
+    def __init__(self, ctx, max_workers=16):
+        self._ctx = ctx
+        self._max_workers = max_workers
         self._log = logging.getLogger(__name__)
 
     def collect(self): # pylint: disable=missing-docstring
@@ -283,48 +515,66 @@ class ClusterNodeConfigCollector:
                 labels=['id', 'node', 'type']),
         }
 
-        for node in self._pve.nodes.get():
-            # The nodes/{node} api call will result in requests being forwarded
-            # from the api node to the target node. Those calls can fail if the
-            # target node is offline or otherwise unable to respond to the
-            # request. In that case it is better to just skip scraping the
-            # config for guests on that particular node and continue with the
-            # next one in order to avoid failing the whole scrape.
+        # The nodes/{node} api call will result in requests being forwarded
+        # from the api node to the target node. Those calls fail if the
+        # target node is offline. Skip guests on nodes which are known to be
+        # offline up front instead of waiting for each of those calls to fail.
+        online_nodes = {node['node'] for node in self._ctx.nodes if node.get('status') == 'online'}
+        guests = [guest for guest in self._ctx.resources_vm if guest['node'] in online_nodes]
+
+        # Fetching the config requires one api call per guest. Those are
+        # dispatched to a thread pool, the metrics are populated from the
+        # calling thread only.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers) as executor:
             try:
-                # Qemu
-                vmtype = 'qemu'
-                for vmdata in self._pve.nodes(node['node']).qemu.get():
-                    config = self._pve.nodes(node['node']).qemu(vmdata['vmid']).config.get().items()
-                    for key, metric_value in config:
-                        label_values = ["%s/%s" % (vmtype, vmdata['vmid']), node['node'], vmtype]
-                        if key in metrics:
-                            metrics[key].add_metric(label_values, metric_value)
-                # LXC
-                vmtype = 'lxc'
-                for vmdata in self._pve.nodes(node['node']).lxc.get():
-                    config = self._pve.nodes(node['node']).lxc(vmdata['vmid']).config.get().items()
-                    for key, metric_value in config:
-                        label_values = ["%s/%s" % (vmtype, vmdata['vmid']), node['node'], vmtype]
-                        if key in metrics:
-                            metrics[key].add_metric(label_values, metric_value)
+                futures = [
+                    (guest, executor.submit(self._get_config, guest))
+                    for guest in guests
+                ]
 
-            except ResourceException:
-                self._log.exception(
-                    "Exception thrown while scraping quemu/lxc config from %s",
-                    node['node']
-                )
-                continue
+                for guest, future in futures:
+                    node, vmtype, vmid = guest['node'], guest['type'], guest['vmid']
+
+                    # A node might still be unable to respond to the request. In
+                    # that case it is better to just skip scraping the config for
+                    # that guest and continue with the next one in order to avoid
+                    # failing the whole scrape.
+                    try:
+                        config = future.result()
+                    except ResourceException:
+                        self._log.exception(
+                            "Exception thrown while scraping %s/%s config from %s",
+                            vmtype, vmid, node
+                        )
+                        continue
+
+                    label_values = [f'{vmtype}/{vmid}', node, vmtype]
+                    for key in metrics.keys() & config.keys():
+                        metrics[key].add_metric(label_values, config[key])
+            except BaseException:
+                # Do not wait for queued requests if the scrape fails anyway,
+                # e.g., on timeouts. Only the ones in flight are awaited.
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
 
         return metrics.values()
 
+    def _get_config(self, guest):
+        node_api = self._ctx.pve.nodes(guest['node'])
+        return getattr(node_api, guest['type'])(guest['vmid']).config.get()
+
 
 class VolumesCollector(Collector):
     """
     Collects info on volume sizes - the storage disk usage may not reflect the commitments
     in case of thin allocation.
     """
-    def __init__(self, pve):
-        self._pve = pve
+
+    PREFETCH = ('nodes', 'resources')
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+        self._log = logging.getLogger(__name__)
 
     def collect(self):  # pylint: disable=missing-docstring
         disk_size = GaugeMetricFamily(
@@ -332,22 +582,36 @@ class VolumesCollector(Collector):
             'Proxmox volume commitments',
             labels=['id', 'node', 'storage']
         )
+
+        # Storages per node as well as their type and state are available
+        # from the cluster resources, no need to list them on every node.
+        node_storages = collections.defaultdict(list)
+        for storage in self._ctx.resources_by_type['storage']:
+            node_storages[storage['node']].append(storage)
+
         seen_shared_storages = set()
-        for node in self._pve.nodes.get():
+        for node in self._ctx.nodes:
             # The nodes/{node} api call will result in requests being forwarded
-            # from the api node to the target node. Those calls can fail if the
-            # target node is offline or otherwise unable to respond to the
-            # request. In that case it is better to just skip scraping the
-            # config for guests on that particular node and continue with the
-            # next one in order to avoid failing the whole scrape.
+            # from the api node to the target node. Those calls fail if the
+            # target node is offline. Skip nodes which are known to be offline
+            # up front instead of waiting for the calls to fail.
+            if node.get('status') != 'online':
+                continue
+
+            # A node might still be unable to respond to the request. In that
+            # case it is better to just skip scraping the volumes on that
+            # particular node and continue with the next one in order to avoid
+            # failing the whole scrape.
             try:
-                storage_api = self._pve.nodes(node['node']).storage
-                for storage in storage_api.get():
-                    if not (storage['type'] != 'dir' and storage['active']):
-                        continue
-                    if storage['shared'] and storage['storage'] in seen_shared_storages:
+                storage_api = self._ctx.pve.nodes(node['node']).storage
+                for storage in node_storages[node['node']]:
+                    if storage.get('plugintype') == 'dir' or storage['status'] != 'available':
                         continue
-                    else:
+
+                    # Shared storages only need to be queried on one node.
+                    if storage['shared']:
+                        if storage['storage'] in seen_shared_storages:
+                            continue
                         seen_shared_storages.add(storage['storage'])
 
                     for disk in storage_api(storage['storage']).content.get():
@@ -355,7 +619,7 @@ class VolumesCollector(Collector):
                                               storage['storage']], disk['size'])
             except ResourceException:
                 self._log.exception(
-                    "Exception thrown while scraping quemu/lxc config from %s",
+                    "Exception thrown while scraping volumes from %s",
                     node['node']
                 )
                 continue
@@ -366,51 +630,214 @@ class ClusterCustomMetricsCollector(Collector):
     """
     Collects custom labels defined in the Notes section
     """
-    def __init__(self, pve):
-        self._pve = pve
+    PREFETCH = ('cluster_options',)
+
+    def __init__(self, ctx):
+        self._ctx = ctx
 
     def collect(self):
         metrics = []
-        notes = self._pve.cluster.options.get().get('description', '')
-        if m := re.match(r'#+\s*Prometheus metrics\s*```(.*?)```', notes, re.MULTILINE | re.DOTALL):
+        notes = self._ctx.cluster_options.get('description', '')
+        if m := _NOTES_METRICS_RE.match(notes):
             custom_metrics_text = m.group(1)
 
             for metric in text_string_to_metric_families(custom_metrics_text):
                 metric.name = f'pve_{metric.name}'
-                new_samples = [
-                    Sample(name=f'pve_{sample.name}', labels=sample.labels | {'__source': 'Datacenter > Notes'},
-                           exemplar=sample.exemplar, value=sample.value)
+                metric.samples = [
+                    sample._replace(name=f'pve_{sample.name}',
+                                    labels=sample.labels | _NOTES_SOURCE_LABELS)
                     for sample in metric.samples
                 ]
-                metric.samples = new_samples
 
                 metrics.append(metric)
 
         return metrics
 
 
-def collect_pve(config, host, options: CollectorsOptions):
-    """Scrape a host and return prometheus text format for it"""
+class OrjsonSerializer(JsonSerializer):
+    """
+    Proxmoxer serializer decoding responses using orjson.
+    """
+
+    def loads(self, response):
+        try:
+            return orjson.loads(response.content)['data'] # pylint: disable=no-member
+        except ValueError:
+            return super().loads(response)
+
+def _freeze(value):
+    """
+    Return a hashable representation of a config value parsed from yaml.
+    """
+
+    if isinstance(value, Mapping):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+_PVE_INSTANCES = collections.OrderedDict()
+_PVE_INSTANCES_MAXSIZE = 32
+_PVE_INSTANCES_LOCK = threading.Lock()
+
+def _get_pve(host, config, config_key):
+    """
+    Return a ProxmoxAPI instance for the given host and config. Instances are
+    cached in order to reuse the auth ticket and keep-alive connections
+    across scrapes.
+    """
+
+    with _PVE_INSTANCES_LOCK:
+        pve = _PVE_INSTANCES.get((host, config_key))
+        if pve is not None:
+            _PVE_INSTANCES.move_to_end((host, config_key))
+            return pve
 
     pve = ProxmoxAPI(host, **config)
 
-    registry = CollectorRegistry()
+    # Allow concurrent requests (e.g., from the config collector) to share
+    # keep-alive connections instead of opening new ones.
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    pve._store['session'].mount('https://', adapter) # pylint: disable=protected-access
+
+    # Decode large responses (e.g., /cluster/resources) faster if available.
+    if orjson is not None:
+        pve._store['serializer'] = OrjsonSerializer() # pylint: disable=protected-access
+
+    with _PVE_INSTANCES_LOCK:
+        _PVE_INSTANCES[(host, config_key)] = pve
+        if len(_PVE_INSTANCES) > _PVE_INSTANCES_MAXSIZE:
+            _PVE_INSTANCES.popitem(last=False)
+
+    return pve
+
+def _evict_pve(host, config_key):
+    """
+    Drop the cached ProxmoxAPI instance for the given host and config.
+    """
+
+    with _PVE_INSTANCES_LOCK:
+        _PVE_INSTANCES.pop((host, config_key), None)
+
+
+class _MetricFamilies(Collector):
+    """
+    Collector returning already collected metric families.
+    """
+
+    def __init__(self, families):
+        self._families = families
+
+    def collect(self):
+        return self._families
+
+def _generate_chunks(families, stale):
+    """
+    Yield the prometheus text format one metric family at a time.
+    """
 
-    registry.register(ClusterCustomMetricsCollector(pve))
+    for family in families:
+        yield generate_latest(_MetricFamilies([family]))
+
+    yield generate_latest(_MetricFamilies([GaugeMetricFamily(
+        'pve_scrape_stale',
+        'Whether the metrics are served from a previous scrape',
+        value=stale)]))
+
+_LAST_FAMILIES = {}
+_LAST_FAMILIES_MAXSIZE = 32
+_LAST_FAMILIES_LOCK = threading.Lock()
+
+def _store_last_families(key, families, max_stale):
+    """
+    Remember the metrics of a successful scrape for the stale fallback and
+    drop the ones which are too old to be served anyway.
+    """
+
+    now = time.monotonic()
+    with _LAST_FAMILIES_LOCK:
+        expired = [other for other, (stored, _) in _LAST_FAMILIES.items()
+                   if now - stored > max_stale]
+        for other in expired:
+            del _LAST_FAMILIES[other]
+
+        # Keep entries ordered by age and bound their number, each of them
+        # holds all metric families of a target.
+        _LAST_FAMILIES.pop(key, None)
+        _LAST_FAMILIES[key] = (now, families)
+        if len(_LAST_FAMILIES) > _LAST_FAMILIES_MAXSIZE:
+            del _LAST_FAMILIES[next(iter(_LAST_FAMILIES))]
+
+def _collect_families(config, host, config_key, options, cache_ttl):
+    """
+    Scrape a host and return a list of metric families for it.
+    """
+
+    pve = _get_pve(host, config, config_key)
+    ctx = PveContext(TimedPve(pve, host), (host, config_key), cache_ttl)
+
+    collectors = [ClusterCustomMetricsCollector(ctx)]
 
     if options.status:
-        registry.register(StatusCollector(pve))
+        collectors.append(StatusCollector(ctx))
     if options.resources:
-        registry.register(ClusterResourcesCollector(pve))
+        collectors.append(ClusterResourcesCollector(ctx))
     if options.node:
-        registry.register(ClusterNodeCollector(pve))
+        collectors.append(ClusterNodeCollector(ctx))
     if options.cluster:
-        registry.register(ClusterInfoCollector(pve))
+        collectors.append(ClusterInfoCollector(ctx))
     if options.config:
-        registry.register(ClusterNodeConfigCollector(pve))
+        collectors.append(ClusterNodeConfigCollector(ctx))
     if options.version:
-        registry.register(VersionCollector(pve))
+        collectors.append(VersionCollector(ctx))
     if options.volumes:
-        registry.register(VolumesCollector(pve))
+        collectors.append(VolumesCollector(ctx))
+
+    registry = CollectorRegistry()
+    for collector in collectors:
+        registry.register(collector)
+
+    # Issue the requests for endpoints shared by the collectors concurrently
+    # instead of one after another.
+    ctx.prefetch({name for collector in collectors for name in getattr(collector, 'PREFETCH', ())})
+
+    return list(registry.collect())
+
+def collect_pve(config, host, options: CollectorsOptions, cache_ttl=5, max_stale=0):
+    """
+    Scrape a host and return an iterable of prometheus text format chunks for
+    it. If the host is unreachable, the metrics of the last successful scrape
+    are returned instead, provided they are not older than max_stale seconds.
+    """
+
+    config_key = _freeze(config)
+
+    try:
+        # Creating the api instance logs in with password auth. Failures
+        # there fall back to stale metrics as well.
+        families = _collect_families(config, host, config_key, options, cache_ttl)
+    except (AuthenticationError, ResourceException, RequestException) as error:
+        # Drop the cached instance if renewing the ticket failed (e.g.,
+        # because it expired while no scrapes arrived) or if the ticket or
+        # token got rejected. A fresh one is created on the next scrape.
+        if isinstance(error, AuthenticationError) or (
+                isinstance(error, ResourceException) and error.status_code == 401):
+            _evict_pve(host, config_key)
+
+        with _LAST_FAMILIES_LOCK:
+            last = _LAST_FAMILIES.get((host, config_key))
+        if last is None or time.monotonic() - last[0] > max_stale:
+            raise
+
+        logging.getLogger(__name__).exception(
+            "Exception thrown while scraping %s, serving metrics from previous scrape",
+            host
+        )
+        return _generate_chunks(last[1], 1)
+
+    if max_stale > 0:
+        _store_last_families((host, config_key), families, max_stale)
 
-    return generate_latest(registry)
+    # Collection is complete at this point, errors are raised above. Only
+    # the encoding is deferred until the response is written.
+    return _generate_chunks(families, 0)
@@ -18,13 +18,15 @@ class PveExporterApplication:
     Proxmox VE prometheus collector HTTP handler.
     """
 
-    # pylint: disable=no-self-use
+    # pylint: disable=no-self-use,too-many-arguments
 
-    def __init__(self, config, duration, errors, collectors):
+    def __init__(self, config, duration, errors, collectors, cache_ttl, max_stale):
         self._config = config
         self._duration = duration
         self._errors = errors
         self._collectors = collectors
+        self._cache_ttl = cache_ttl
+        self._max_stale = max_stale
 
         self._log = logging.getLogger(__name__)
 
@@ -35,7 +37,9 @@ class PveExporterApplication:
 
         if module in self._config:
             start = time.time()
-            output = collect_pve(self._config[module], target, self._collectors)
+            output = collect_pve(self._config[module], target, self._collectors,
+                                 self._cache_ttl, self._max_stale)
+            # The output is an iterable of chunks, it is streamed to the client.
             response = Response(output)
             response.headers['content-type'] = CONTENT_TYPE_LATEST
             self._duration.labels(module).observe(time.time() - start)
@@ -132,7 +136,7 @@ class StandaloneGunicornApplication(gunicorn.app.base.BaseApplication):
         return self.application
 
 
-def start_http_server(config, gunicorn_options, collectors):
+def start_http_server(config, gunicorn_options, collectors, cache_ttl=5, max_stale=0):
     """
     Start a HTTP API server for Proxmox VE prometheus collector.
     """
@@ -155,5 +159,6 @@ def start_http_server(config, gunicorn_options, collectors):
         # pylint: disable=no-member
         duration.labels(module)
 
-    app = PveExporterApplication(config, duration, errors, collectors)
+    app = PveExporterApplication(config, duration, errors, collectors, cache_ttl,
+                                 max_stale)
     StandaloneGunicornApplication(app, gunicorn_options).run()
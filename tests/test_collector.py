@@ -0,0 +1,48 @@
+import unittest
+
+from prometheus_client import REGISTRY
+
+from pve_exporter.collector import TimedPve
+
+
+class FakeResource:
+    def __init__(self, error=None):
+        self._error = error
+
+    def __getattr__(self, item):
+        return self
+
+    def __call__(self, resource_id):
+        return self
+
+    def get(self, **params):
+        if self._error:
+            raise self._error
+        return []
+
+
+class TimedPveTest(unittest.TestCase):
+    def test_endpoint_placeholders(self):
+        pve = TimedPve(FakeResource(), 'pve-a.example.com')
+        pve.nodes('pve1').qemu(100).config.get()
+
+        count = REGISTRY.get_sample_value('pve_scrape_fetch_seconds_count', {
+            'target': 'pve-a.example.com',
+            'endpoint': '/nodes/{node}/qemu/{vmid}/config',
+        })
+        self.assertEqual(count, 1)
+
+    def test_errors_counted_per_target(self):
+        pve = TimedPve(FakeResource(ValueError('boom')), 'pve-b.example.com')
+        with self.assertRaises(ValueError):
+            pve.cluster.status.get()
+
+        errors = REGISTRY.get_sample_value('pve_scrape_fetch_errors_total', {
+            'target': 'pve-b.example.com',
+            'endpoint': '/cluster/status',
+        })
+        self.assertEqual(errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()